@@ -4,23 +4,98 @@ eBird Alert Scraper
 Fetches rare bird sightings from eBird alerts and generates HTML/JSON output.
 """
 
+import functools
+import hashlib
 import json
 import os
 import sys
-from datetime import datetime
+import time
+from html import escape
 from pathlib import Path
 
+import lxml.html
 import requests
-from bs4 import BeautifulSoup
-from jinja2 import Environment, FileSystemLoader
+from lxml import etree
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from lxml.cssselect import CSSSelector
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Configuration
 ALERT_URL = "https://ebird.org/alert/summary?sid=SN35466"
 USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-
-
+HEADERS = {
+    "User-Agent": USER_AGENT,
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    # Only advertises br when the brotli package is installed to decode it
+    "Accept-Encoding": make_headers(accept_encoding=True)["accept-encoding"],
+}
+
+OUTPUT_DIR = Path(__file__).resolve().parent.parent / "docs"
+
+# Alerts page ETag from the last run, kept outside docs/ so it is not published
+ETAG_PATH = Path(__file__).resolve().parent.parent / ".cache" / "alerts.etag"
+
+# Shared HTTP session so connections to ebird.org are pooled and kept alive
+_SESSION = requests.Session()
+_SESSION.headers.update(HEADERS)
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False,
+    ),
+))
+
+# Template environment, built once at import; None falls back to generate_simple_html
+_TEMPLATE_DIR = Path(__file__).resolve().parent.parent / "templates"
+_JINJA_ENV = Environment(
+    loader=FileSystemLoader(_TEMPLATE_DIR),
+    bytecode_cache=FileSystemBytecodeCache(),
+    auto_reload=False,
+    autoescape=True,
+) if _TEMPLATE_DIR.exists() else None
+
+
+
+def _class_contains(tag, needle):
+    """Compile an XPath matching descendant tags whose class contains needle, ignoring case."""
+    lowered = "translate(@class, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')"
+    return etree.XPath(f"descendant::{tag}[contains({lowered}, '{needle}')]")
+
+
+# Selectors are compiled to XPath once at import rather than on every call
+_SEL_CONTENT = CSSSelector("div#content")
+_SEL_MAIN = CSSSelector("main")
+_SEL_CHECKLIST_LINK = CSSSelector('a[href*="/checklist/"]')
+_SEL_SPECIES_LINK = _class_contains("a", "species")
+_SEL_SPECIES_SPAN = _class_contains("span", "species")
+_SEL_STRONG = CSSSelector("strong")
+_SEL_BOLD = CSSSelector("b")
+_SEL_LOCATION = _class_contains("*", "location")
+_SEL_HOTSPOT_LINK = CSSSelector('a[href*="/hotspot/"]')
+_SEL_DATE = _class_contains("*", "date")
+_SEL_OBSERVER = _class_contains("*", "observer")
+_SEL_PROFILE_LINK = CSSSelector('a[href*="/profile/"]')
+_SEL_LD_JSON = CSSSelector('script[type="application/ld+json"]')
+
+
+@functools.lru_cache(maxsize=1)
 def get_cookies_from_env():
-    """Parse cookies from environment variable."""
+    """Parse cookies from environment variable.
+
+    The result is cached for the life of the process; treat it as read-only.
+    """
     cookie_string = os.environ.get("EBIRD_COOKIES", "")
     if not cookie_string:
         print("ERROR: EBIRD_COOKIES environment variable not set")
@@ -35,18 +110,57 @@ def get_cookies_from_env():
     return cookies
 
 
-def fetch_alerts(cookies):
-    """Fetch the eBird alerts page."""
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.5",
-    }
+def _cache_key():
+    """Hash this script and the page template, so code or template changes invalidate the ETag."""
+    digest = hashlib.sha256(Path(__file__).read_bytes())
+    template_path = _TEMPLATE_DIR / "index.html"
+    if template_path.exists():
+        digest.update(template_path.read_bytes())
+    return digest.hexdigest()
+
+
+def load_etag(output_dir):
+    """Return the ETag saved by the previous run, or None if it cannot be trusted.
+
+    The ETag is only usable while the outputs it produced still exist and
+    were generated by the current script and template.
+    """
+    output_path = Path(output_dir)
+    if not ((output_path / "data.json").exists() and (output_path / "index.html").exists()):
+        return None
+    if not ETAG_PATH.exists():
+        return None
+    key, _, etag = ETAG_PATH.read_text(encoding="utf-8").partition("\n")
+    if key != _cache_key():
+        return None
+    return etag.strip() or None
+
+
+def save_etag(etag):
+    """Save the alerts page ETag, keyed to the current script and template, for the next run."""
+    ETAG_PATH.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(ETAG_PATH, f"{_cache_key()}\n{etag}".encode("utf-8"))
+
 
-    session = requests.Session()
-    session.cookies.update(cookies)
+def load_sightings(output_dir):
+    """Return the sightings from the previous run's data.json."""
+    json_path = Path(output_dir) / "data.json"
+    return _json_loads(json_path.read_bytes())["sightings"]
 
-    response = session.get(ALERT_URL, headers=headers, timeout=30)
+
+def fetch_alerts(cookies, etag=None):
+    """Fetch the eBird alerts page.
+
+    Returns a (content, encoding, etag) tuple. content is the raw page bytes,
+    or None when the page is unchanged since the given etag.
+    """
+    _SESSION.cookies.update(cookies)
+
+    headers = {"If-None-Match": etag} if etag else None
+    response = _SESSION.get(ALERT_URL, headers=headers, timeout=30)
+
+    if response.status_code == 304:
+        return None, None, etag
 
     if response.status_code != 200:
         print(f"ERROR: Failed to fetch alerts. Status code: {response.status_code}")
@@ -54,12 +168,18 @@ def fetch_alerts(cookies):
             print("ERROR: Redirected to login page. Cookies may have expired.")
         sys.exit(1)
 
-    return response.text
+    # Only trust an explicit charset; requests assumes ISO-8859-1 for bare text/html
+    content_type = response.headers.get("Content-Type", "").lower()
+    encoding = response.encoding if "charset" in content_type else "utf-8"
+
+    return response.content, encoding, response.headers.get("ETag")
 
 
-def parse_alerts(html):
-    """Parse the alerts page and extract sighting data."""
-    soup = BeautifulSoup(html, "html.parser")
+def parse_alerts(html, encoding="utf-8"):
+    """Parse the alerts page (raw bytes in the given encoding, or text) and extract sighting data."""
+    root = _parse_html(html, encoding)
+    if root is None:
+        return []
     sightings = []
 
     # eBird alerts are typically organized in sections by date
@@ -69,43 +189,105 @@ def parse_alerts(html):
     # Try multiple selectors to find sightings
 
     # Look for the main content area
-    content = soup.find("div", {"id": "content"}) or soup.find("main") or soup
+    content = _find_content(root)
 
     # Find species entries - eBird uses different formats
     # Try to find entries with species names and location data
 
-    # Method 1: Look for observation cards/rows
-    obs_rows = content.find_all("div", class_=lambda x: x and ("Observation" in str(x) or "obs" in str(x).lower()))
+    # Walk the content once, sorting candidate elements into the buckets
+    # used by each method below, instead of one full traversal per method
+    observation_rows = []
+    species_items = []
+    table_rows = []
+    checklist_links = []
+    for element in content.iterdescendants("div", "li", "tr", "a"):
+        tag = element.tag
+        if tag == "div":
+            # "observation" contains "obs", so one lowercase test covers both
+            if "obs" in element.get("class", "").lower():
+                observation_rows.append(element)
+        elif tag == "li":
+            if "species" in element.get("class", "").lower():
+                species_items.append(element)
+        elif tag == "tr":
+            table_rows.append(element)
+        elif "/checklist/" in element.get("href", ""):
+            checklist_links.append(element)
 
+    # Method 1: Look for observation cards/rows
     # Method 2: Look for list items with species info
-    if not obs_rows:
-        obs_rows = content.find_all("li", class_=lambda x: x and "species" in str(x).lower())
-
     # Method 3: Look for table rows
-    if not obs_rows:
-        obs_rows = content.find_all("tr")
-
     # Method 4: Look for any links to checklists
-    if not obs_rows:
-        # Find all links that look like checklist links
-        checklist_links = content.find_all("a", href=lambda x: x and "/checklist/" in str(x))
-        for link in checklist_links:
-            parent = link.find_parent(["div", "li", "tr"])
-            if parent and parent not in obs_rows:
-                obs_rows.append(parent)
-
-    for row in obs_rows:
-        sighting = extract_sighting_data(row)
-        if sighting and sighting.get("species"):
-            sightings.append(sighting)
+    # Each method is only tried if the previous ones yielded no sightings
+    methods = (observation_rows, species_items, table_rows, _checklist_parents(checklist_links))
+    for obs_rows in methods:
+        for row in obs_rows:
+            sighting = extract_sighting_data(row)
+            if sighting and sighting.get("species"):
+                sightings.append(sighting)
+        if sightings:
+            break
 
     # If we still have no sightings, try a more generic approach
     if not sightings:
-        sightings = extract_sightings_generic(soup)
+        sightings = extract_sightings_generic(root)
 
     return sightings
 
 
+@functools.lru_cache(maxsize=4)
+def _html_parser(encoding):
+    """Return a shared parser for the given encoding.
+
+    It drops comments and processing instructions while parsing, so they are
+    never allocated as tree nodes or visited by the selectors.
+    """
+    try:
+        return lxml.html.HTMLParser(
+            encoding=encoding, remove_comments=True, remove_pis=True, collect_ids=False
+        )
+    except LookupError:
+        return _html_parser("utf-8")
+
+
+def _parse_html(html, encoding="utf-8"):
+    """Parse an HTML document, returning None if it is empty."""
+    try:
+        return lxml.html.document_fromstring(html, parser=_html_parser(encoding))
+    except etree.ParserError:
+        return None
+
+
+def _checklist_parents(links):
+    """Yield the nearest div, li or tr ancestor of each checklist link, once each."""
+    seen = set()
+    for link in links:
+        parent = next(link.iterancestors("div", "li", "tr"), None)
+        if parent is not None and parent not in seen:
+            seen.add(parent)
+            yield parent
+
+
+def _find_content(root):
+    """Return the page's main content element, or the root if there is none."""
+    content = _find(root, _SEL_CONTENT, _SEL_MAIN)
+    return root if content is None else content
+
+
+def _find(element, *selectors):
+    """Return the first match of the first compiled selector that matches, or None."""
+    for selector in selectors:
+        matches = selector(element)
+        if matches:
+            return matches[0]
+    return None
+
+
+def _text(element):
+    """Return the element's text with each fragment stripped, like get_text(strip=True)."""
+    return "".join(fragment.strip() for fragment in element.itertext())
+
+
 def extract_sighting_data(element):
     """Extract sighting data from an element."""
     sighting = {
@@ -118,39 +300,28 @@ def extract_sighting_data(element):
     }
 
     # Find species name - usually in a link or strong tag
-    species_elem = (
-        element.find("a", class_=lambda x: x and "species" in str(x).lower()) or
-        element.find("span", class_=lambda x: x and "species" in str(x).lower()) or
-        element.find("strong") or
-        element.find("b")
-    )
-    if species_elem:
-        sighting["species"] = species_elem.get_text(strip=True)
+    species_elem = _find(element, _SEL_SPECIES_LINK, _SEL_SPECIES_SPAN, _SEL_STRONG, _SEL_BOLD)
+    if species_elem is not None:
+        sighting["species"] = _text(species_elem)
 
     # Find location
-    location_elem = (
-        element.find(class_=lambda x: x and "location" in str(x).lower()) or
-        element.find("a", href=lambda x: x and "/hotspot/" in str(x))
-    )
-    if location_elem:
-        sighting["location"] = location_elem.get_text(strip=True)
+    location_elem = _find(element, _SEL_LOCATION, _SEL_HOTSPOT_LINK)
+    if location_elem is not None:
+        sighting["location"] = _text(location_elem)
 
     # Find date
-    date_elem = element.find(class_=lambda x: x and "date" in str(x).lower())
-    if date_elem:
-        sighting["date"] = date_elem.get_text(strip=True)
+    date_elem = _find(element, _SEL_DATE)
+    if date_elem is not None:
+        sighting["date"] = _text(date_elem)
 
     # Find observer
-    observer_elem = (
-        element.find(class_=lambda x: x and "observer" in str(x).lower()) or
-        element.find("a", href=lambda x: x and "/profile/" in str(x))
-    )
-    if observer_elem:
-        sighting["observer"] = observer_elem.get_text(strip=True)
+    observer_elem = _find(element, _SEL_OBSERVER, _SEL_PROFILE_LINK)
+    if observer_elem is not None:
+        sighting["observer"] = _text(observer_elem)
 
     # Find checklist URL
-    checklist_link = element.find("a", href=lambda x: x and "/checklist/" in str(x))
-    if checklist_link:
+    checklist_link = _find(element, _SEL_CHECKLIST_LINK)
+    if checklist_link is not None:
         href = checklist_link.get("href", "")
         if href.startswith("/"):
             href = "https://ebird.org" + href
@@ -159,7 +330,7 @@ def extract_sighting_data(element):
     return sighting
 
 
-def extract_sightings_generic(soup):
+def extract_sightings_generic(root):
     """Generic extraction when specific selectors fail."""
     sightings = []
 
@@ -167,10 +338,10 @@ def extract_sightings_generic(soup):
     # This is a fallback approach
 
     # Look for any structured data
-    scripts = soup.find_all("script", type="application/ld+json")
+    scripts = _SEL_LD_JSON(root)
     for script in scripts:
         try:
-            data = json.loads(script.string)
+            data = _json_loads(script.text)
             # Process structured data if available
             if isinstance(data, list):
                 for item in data:
@@ -183,12 +354,39 @@ def extract_sightings_generic(soup):
                             "checklist_url": item.get("url", ""),
                             "count": ""
                         })
-        except (json.JSONDecodeError, AttributeError):
+        except (json.JSONDecodeError, TypeError, AttributeError):
             pass
 
     return sightings
 
 
+def _json_loads(text):
+    """Decode JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _json_dumps(data):
+    """Encode data as compact UTF-8 JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def write_atomic(path, content):
+    """Write bytes to a temporary file and swap it into place, so readers never see a partial file."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(content)
+    os.replace(tmp_path, path)
+
+
+@functools.lru_cache(maxsize=4)
+def _template(name):
+    """Load a template once per process."""
+    return _JINJA_ENV.get_template(name)
+
+
 def generate_output(sightings, output_dir):
     """Generate HTML and JSON output files."""
     output_path = Path(output_dir)
@@ -196,7 +394,7 @@ def generate_output(sightings, output_dir):
 
     # Prepare data
     data = {
-        "last_updated": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC"),
+        "last_updated": time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime()),
         "alert_url": ALERT_URL,
         "sightings": sightings,
         "count": len(sightings)
@@ -204,39 +402,35 @@ def generate_output(sightings, output_dir):
 
     # Write JSON
     json_path = output_path / "data.json"
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    write_atomic(json_path, _json_dumps(data))
     print(f"Written: {json_path}")
 
     # Generate HTML
-    template_dir = Path(__file__).parent.parent / "templates"
-    if template_dir.exists():
-        env = Environment(loader=FileSystemLoader(template_dir))
-        template = env.get_template("index.html")
-        html_content = template.render(**data)
+    if _JINJA_ENV is not None:
+        html_content = _template("index.html").render(**data)
     else:
         # Fallback: generate simple HTML if template doesn't exist
         html_content = generate_simple_html(data)
 
     html_path = output_path / "index.html"
-    with open(html_path, "w", encoding="utf-8") as f:
-        f.write(html_content)
+    write_atomic(html_path, html_content.encode("utf-8"))
     print(f"Written: {html_path}")
 
 
 def generate_simple_html(data):
     """Generate simple HTML without template."""
-    rows = ""
+    rows_parts = []
     for s in data["sightings"]:
-        checklist = f'<a href="{s["checklist_url"]}" target="_blank">View</a>' if s["checklist_url"] else "-"
-        rows += f"""
+        checklist = f'<a href="{escape(str(s["checklist_url"]))}" target="_blank">View</a>' if s["checklist_url"] else "-"
+        rows_parts.append(f"""
         <tr>
-            <td>{s['species']}</td>
-            <td>{s['location']}</td>
-            <td>{s['date']}</td>
-            <td>{s['observer']}</td>
+            <td>{escape(str(s['species']))}</td>
+            <td>{escape(str(s['location']))}</td>
+            <td>{escape(str(s['date']))}</td>
+            <td>{escape(str(s['observer']))}</td>
             <td>{checklist}</td>
-        </tr>"""
+        </tr>""")
+    rows = "".join(rows_parts)
 
     return f"""<!DOCTYPE html>
 <html lang="en">
@@ -284,20 +478,29 @@ def main():
     cookies = get_cookies_from_env()
     print(f"Loaded {len(cookies)} cookies")
 
+    output_dir = OUTPUT_DIR
+
     # Fetch alerts
     print(f"Fetching alerts from {ALERT_URL}...")
-    html = fetch_alerts(cookies)
-    print(f"Received {len(html)} bytes")
+    html, encoding, etag = fetch_alerts(cookies, load_etag(output_dir))
+    if html is None:
+        # Unchanged page: reuse the previous sightings but still refresh last_updated
+        print("Alerts unchanged since last run, reusing previous sightings")
+        sightings = load_sightings(output_dir)
+        print(f"Loaded {len(sightings)} sightings")
+    else:
+        print(f"Received {len(html)} bytes")
 
-    # Parse alerts
-    print("Parsing sightings...")
-    sightings = parse_alerts(html)
-    print(f"Found {len(sightings)} sightings")
+        # Parse alerts
+        print("Parsing sightings...")
+        sightings = parse_alerts(html, encoding)
+        print(f"Found {len(sightings)} sightings")
 
     # Generate output
-    output_dir = Path(__file__).parent.parent / "docs"
     print(f"Generating output to {output_dir}...")
     generate_output(sightings, output_dir)
+    if html is not None and etag:
+        save_etag(etag)
 
     print("Done!")
 